@@ -1,8 +1,19 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, Response, render_template, request, redirect, url_for, g
+from flask.json.provider import DefaultJSONProvider
 import sqlite3
 import json
+import hashlib
+from jinja2 import DictLoader, FileSystemBytecodeCache
+from werkzeug.middleware.proxy_fix import ProxyFix
 from datetime import datetime
 import os
+import time
+import socket
+import atexit
+import threading
+import queue
+from contextlib import contextmanager
+from functools import lru_cache
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get(
@@ -11,103 +22,385 @@ app.config['SECRET_KEY'] = os.environ.get(
 # Production configuration
 if os.environ.get('FLASK_ENV') == 'production':
     app.config['DEBUG'] = False
+    # The templates are fixed strings; never check them for changes
+    app.config['TEMPLATES_AUTO_RELOAD'] = False
 else:
     app.config['DEBUG'] = True
 
-# Party list
-PARTIES = [
+# The app runs behind the hosting platform's proxy: trust the
+# X-Forwarded-For/-Proto values appended by that many proxies, so
+# request.remote_addr is the client and request.url has the public scheme.
+# Set TRUSTED_PROXY_HOPS=0 when clients connect directly.
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', 1))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS,
+                            x_proto=TRUSTED_PROXY_HOPS)
+
+# Response compression for the HTML pages and /api/results (optional)
+app.config['COMPRESS_MIMETYPES'] = ['text/html', 'application/json']
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_LEVEL'] = 4
+app.config['COMPRESS_BR_LEVEL'] = 4
+# The rankings JSON is just over a kilobyte; the short /vote replies are
+# left alone
+app.config['COMPRESS_MIN_SIZE'] = 256
+# Never buffer /api/stream: SSE events must reach the browser as they happen
+app.config['COMPRESS_STREAMS'] = False
+
+
+class _CompressedBodies:
+    """
+    Flask-Compress cache for bodies the app already serves from its own
+    caches: a view names its body in g.compress_key, and each encoding of
+    it is compressed once. Responses without a key are never stored, and
+    the oldest entries (e.g. rankings since replaced) make way for new ones.
+    """
+    max_size = 128
+
+    def __init__(self):
+        self._bodies = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._bodies.get(key) if key is not None else None
+
+    def set(self, key, value):
+        if key is None:
+            return
+        with self._lock:
+            if key not in self._bodies and len(self._bodies) >= self.max_size:
+                del self._bodies[next(iter(self._bodies))]
+            self._bodies[key] = value
+
+
+def _compressed_body_key(request):
+    """Cache key for Flask-Compress: the view's body key plus the encodings offered"""
+    key = g.get('compress_key')
+    if key is None:
+        return None
+    return key, request.headers.get('Accept-Encoding', '')
+
+
+app.config['COMPRESS_CACHE_BACKEND'] = _CompressedBodies
+app.config['COMPRESS_CACHE_KEY'] = _compressed_body_key
+try:
+    from flask_compress import Compress
+    Compress(app)
+except ImportError:
+    print("Flask-Compress not available, serving responses uncompressed.")
+    print("To enable compression, install: pip install Flask-Compress")
+
+# Fast JSON encoding for the hot endpoints when orjson is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    print("orjson not available, using the standard json module.")
+
+
+def dumps_json(obj):
+    """Serialize obj to compact UTF-8 JSON bytes (orjson when available)"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads_json(data):
+    """Parse JSON bytes or str (orjson when available)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_response(obj):
+    """Like jsonify, but encoded with dumps_json"""
+    return Response(dumps_json(obj), mimetype='application/json')
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask's JSON provider on top of dumps_json/loads_json, so request.json
+    (the /vote body) and any jsonify call get orjson too
+    """
+
+    def dumps(self, obj, **kwargs):
+        return dumps_json(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return loads_json(s)
+
+
+if orjson is not None:
+    app.json = OrjsonProvider(app)
+
+
+# Optional Redis cache shared by all workers (set REDIS_URL to enable);
+# without it each worker only has its own in-process cache
+redis_client = None
+if os.environ.get('REDIS_URL'):
+    try:
+        import redis
+        redis_client = redis.Redis.from_url(os.environ['REDIS_URL'])
+        redis_client.ping()
+        print("✅ Redis cache connected!")
+    except ImportError as e:
+        print(f"Redis module not available ({e}). Using in-process cache only.")
+        print("To use Redis, install: pip install redis")
+        redis_client = None
+    except Exception as e:
+        print(f"Redis connection failed ({e}). Using in-process cache only.")
+        redis_client = None
+
+
+def _redis(command, *args, **kwargs):
+    """
+    Run a Redis command, e.g. _redis('get', key). Returns None when Redis
+    is disabled or the call fails, which callers treat as a cache miss.
+    """
+    if redis_client is None:
+        return None
+    try:
+        return getattr(redis_client, command)(*args, **kwargs)
+    except Exception as e:
+        app.logger.warning(f"Redis {command} failed: {e}")
+        return None
+
+
+# Party list; a tuple, since positions double as party ids (PARTY_IDS)
+PARTIES = (
     "বাংলাদেশ জাতীয়তাবাদী দল - বি.এন.পি",
     "বাংলাদেশ আওয়ামী লীগ",
     "জাতীয় নাগরিক পার্টি - এনসিপি",
     "বাংলাদেশ জামায়াতে ইসলামী",
     "জাতীয় পার্টি",
-]
-
-# Meme URLs for different rankings
-RANKING_MEMES = {
-    1: "https://i.imgflip.com/2/1bij.jpg",  # Success Kid
-    2: "https://i.imgflip.com/2/2fm6x.jpg",  # Disaster Girl
-    3: "https://i.imgflip.com/2/5c7lwq.jpg",  # This is Fine
-    4: "https://i.imgflip.com/2/1o00in.jpg",  # Sad Pablo Escobar
-    5: "https://i.imgflip.com/2/1g8my4.jpg"  # Crying Cat
-}
+)
+
+# Hash-based membership check for vote validation; PARTIES keeps the order
+PARTIES_SET = frozenset(PARTIES)
+
+# votes and tallies store a party as its index in PARTIES (a small integer
+# instead of a long UTF-8 name), so append new parties at the end
+PARTY_IDS = {party: party_id for party_id, party in enumerate(PARTIES)}
+
+# Maps the party names stored by older databases to their ids (-1 for
+# names no longer in PARTIES) while migrating; see init_db()
+SQL_PARTY_ID_CASE = ('CASE party ' + ' '.join(['WHEN %s THEN %s'] * len(PARTIES))
+                     + ' ELSE -1 END')
+PARTY_ID_CASE_PARAMS = tuple(value for item in PARTY_IDS.items() for value in item)
+
+# Meme URLs for different rankings, indexed by rank - 1; ranks past the
+# end reuse the last one
+RANKING_MEMES = (
+    "https://i.imgflip.com/2/1bij.jpg",  # Success Kid
+    "https://i.imgflip.com/2/2fm6x.jpg",  # Disaster Girl
+    "https://i.imgflip.com/2/5c7lwq.jpg",  # This is Fine
+    "https://i.imgflip.com/2/1o00in.jpg",  # Sad Pablo Escobar
+    "https://i.imgflip.com/2/1g8my4.jpg"  # Crying Cat
+)
 
 # Database configuration - PostgreSQL support with fallback
+SQLITE_DB = 'voting.db'
+
+# The backend is decided once at startup: PostgreSQL when DATABASE_URL
+# points at it, otherwise SQLite. init_db() switches to SQLite for good if
+# PostgreSQL turns out to be unusable.
+DATABASE_URL = os.environ.get('DATABASE_URL') or ''
+if DATABASE_URL.startswith('postgres://'):
+    # Fix postgres:// URL to postgresql://
+    DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
+USING_POSTGRES = DATABASE_URL.startswith('postgres')
+
+# The PostgreSQL driver is imported once here; without it init_db() falls
+# back to SQLite
+try:
+    import psycopg2
+    import psycopg2.extensions
+    import psycopg2.pool
+except ImportError:
+    psycopg2 = None
+HAS_PSYCOPG2 = psycopg2 is not None
+
+if HAS_PSYCOPG2:
+    class _PGConnection(psycopg2.extensions.connection):
+        """psycopg2 connection that remembers whether it has run _prepare_statements()"""
+        statements_prepared = False
+
+# SQLite tuning: WAL lets pollers read while a vote is written and is
+# persistent in the database file; the rest are per-connection settings
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-20000',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA busy_timeout=5000',
+    # Steady polling keeps readers on the WAL; cap the file it can leave
+    # behind once a checkpoint does get through
+    'PRAGMA journal_size_limit=67108864',
+)
+
+# Long-lived SQLite connections are checked out per query and handed back,
+# so the page cache stays warm across requests instead of reopening the
+# file every time. A checkout pool (rather than one connection per thread)
+# also works under gevent, where every request runs in its own greenlet.
+SQLITE_POOL_SIZE = 8
+_sqlite_idle = []  # idle connections, most recently returned last
+_sqlite_pool_lock = threading.Lock()
+
+# WAL allows many readers but only one writer at a time, so writes
+# (db_transaction) share a single dedicated connection handed around
+# through this one-slot queue: concurrent voters in a worker wait here and
+# wake as soon as it is free, instead of sleeping in SQLite's busy handler.
+# The slot holds None until the first write opens the connection.
+_sqlite_writer = queue.Queue(maxsize=1)
+_sqlite_writer.put(None)
+# Seconds a write waits for the writer before failing (rather than hanging)
+SQLITE_WRITER_TIMEOUT = 10
+
+
+def _get_sqlite_connection():
+    """Check out an idle pooled SQLite connection, opening one if none is free"""
+    with _sqlite_pool_lock:
+        if _sqlite_idle:
+            return _sqlite_idle.pop()
+
+    # Connections move between threads/greenlets, one user at a time
+    conn = sqlite3.connect(SQLITE_DB, check_same_thread=False)
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+@atexit.register
+def _close_sqlite_connections():
+    """Close every pooled SQLite connection (after startup and at shutdown)"""
+    with _sqlite_pool_lock:
+        connections = _sqlite_idle[:]
+        del _sqlite_idle[:]
+    try:
+        connections.append(_sqlite_writer.get_nowait())
+    except queue.Empty:
+        pass  # a write is still in flight
+    else:
+        # The next write opens a fresh writer connection
+        _sqlite_writer.put(None)
+    for conn in connections:
+        if conn is not None:
+            # SQLite recommends this before closing long-lived connections
+            conn.execute('PRAGMA optimize')
+            conn.close()
 
 
-def get_db_connection():
-    """Get database connection with PostgreSQL support and SQLite fallback"""
-    database_url = os.environ.get('DATABASE_URL')
+# PostgreSQL connections come from a psycopg2 ThreadedConnectionPool, so
+# queries skip the TCP/auth handshake. psycopg2's pool raises instead of
+# waiting when every connection is busy, so a semaphore makes callers
+# (threads or greenlets) queue for a free slot instead.
+PG_POOL_MAX = int(os.environ.get('PG_POOL_MAX', 20))
+_pg_pool = None
+_pg_pool_lock = threading.Lock()
+_pg_pool_slots = threading.BoundedSemaphore(PG_POOL_MAX)
+
+
+def _get_pg_connection(database_url):
+    """Check out a pooled PostgreSQL connection, creating the pool on first use"""
+    global _pg_pool
+    if _pg_pool is None:
+        with _pg_pool_lock:
+            if _pg_pool is None:
+                _pg_pool = psycopg2.pool.ThreadedConnectionPool(
+                    1, PG_POOL_MAX, database_url, connection_factory=_PGConnection)
+
+    _pg_pool_slots.acquire()
+    try:
+        conn = _pg_pool.getconn()
+    except Exception:
+        _pg_pool_slots.release()
+        raise
 
-    if database_url and database_url.startswith('postgres'):
+    if not conn.statements_prepared:
         try:
-            # Try to import and use psycopg2-binary first
-            try:
-                import psycopg2
-            except ImportError:
-                print("psycopg2 not available, trying psycopg2-binary...")
-                import psycopg2  # This will still fail, but we handle it below
+            _prepare_statements(conn)
+        except Exception:
+            release_db_connection(conn)
+            raise
+    return conn
 
-            # Fix postgres:// URL to postgresql://
-            if database_url.startswith('postgres://'):
-                database_url = database_url.replace(
-                    'postgres://', 'postgresql://', 1)
 
-            return psycopg2.connect(database_url)
+def _close_pg_pool():
+    """Close every pooled PostgreSQL connection; the next query opens a new pool"""
+    global _pg_pool
+    with _pg_pool_lock:
+        if _pg_pool is not None:
+            _pg_pool.closeall()
+            _pg_pool = None
 
-        except ImportError as e:
-            print(
-                f"PostgreSQL module not available ({e}). Falling back to SQLite.")
-            print("To use PostgreSQL, install: pip install psycopg2-binary")
-            return sqlite3.connect('voting.db')
+
+def release_db_connection(conn):
+    """Return a connection after use to the pool it came from"""
+    if isinstance(conn, sqlite3.Connection):
+        with _sqlite_pool_lock:
+            if len(_sqlite_idle) < SQLITE_POOL_SIZE:
+                _sqlite_idle.append(conn)
+                return
+        conn.close()
+        return
+
+    # The pool rolls back anything left open and drops broken connections
+    try:
+        _pg_pool.putconn(conn, close=bool(conn.closed))
+    finally:
+        _pg_pool_slots.release()
+
+
+def get_db_connection():
+    """Get database connection with PostgreSQL support and SQLite fallback"""
+    if USING_POSTGRES:
+        try:
+            return _get_pg_connection(DATABASE_URL)
         except Exception as e:
             print(
                 f"PostgreSQL connection failed ({e}). Falling back to SQLite.")
-            return sqlite3.connect('voting.db')
+            return _get_sqlite_connection()
     else:
         # SQLite connection
-        return sqlite3.connect('voting.db')
+        return _get_sqlite_connection()
 
 
 def is_postgresql_available():
-    """Check if PostgreSQL connection is available"""
-    database_url = os.environ.get('DATABASE_URL')
-    if not database_url or not database_url.startswith('postgres'):
-        return False
-
-    try:
-        import psycopg2
-        if database_url.startswith('postgres://'):
-            database_url = database_url.replace(
-                'postgres://', 'postgresql://', 1)
-        conn = psycopg2.connect(database_url)
-        conn.close()
-        return True
-    except:
-        return False
+    """Whether the app is running on PostgreSQL (decided at startup, no I/O)"""
+    return USING_POSTGRES
 
 
 def init_db():
     """Initialize the database with proper error handling"""
-    database_url = os.environ.get('DATABASE_URL')
+    global USING_POSTGRES
     using_postgresql = False
 
-    if database_url and database_url.startswith('postgres'):
+    if USING_POSTGRES and not HAS_PSYCOPG2:
+        print("❌ PostgreSQL module not available: psycopg2")
+        print("💡 To fix: pip install psycopg2-binary")
+        print("🔄 Falling back to SQLite...")
+    elif USING_POSTGRES:
         try:
-            import psycopg2
-
-            # Fix postgres:// URL to postgresql://
-            if database_url.startswith('postgres://'):
-                database_url = database_url.replace(
-                    'postgres://', 'postgresql://', 1)
-
-            conn = psycopg2.connect(database_url)
+            conn = psycopg2.connect(DATABASE_URL)
             c = conn.cursor()
 
+            # Older databases stored the party name in every vote; convert
+            # the column to ids in place (one table rewrite, which also
+            # rebuilds idx_votes_party) and rebuild the tallies from it
+            c.execute("""SELECT 1 FROM information_schema.columns
+                WHERE table_schema = current_schema()
+                AND table_name = 'votes' AND column_name = 'party'""")
+            if c.fetchone():
+                c.execute('ALTER TABLE votes ALTER COLUMN party TYPE SMALLINT USING '
+                          + SQL_PARTY_ID_CASE, PARTY_ID_CASE_PARAMS)
+                c.execute('ALTER TABLE votes RENAME COLUMN party TO party_id')
+                c.execute('DROP TABLE IF EXISTS tallies')
+
             # Create votes table
             c.execute('''CREATE TABLE IF NOT EXISTS votes (
                 id SERIAL PRIMARY KEY,
-                party TEXT NOT NULL,
+                party_id SMALLINT NOT NULL,
                 ip_address TEXT NOT NULL,
                 timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )''')
@@ -118,41 +411,133 @@ def init_db():
                 voted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )''')
 
+            # Index votes by party so the per-party tally is index-only
+            c.execute(
+                'CREATE INDEX IF NOT EXISTS idx_votes_party ON votes(party_id)')
+
+            # Create tallies table (running per-party totals for results)
+            c.execute('''CREATE TABLE IF NOT EXISTS tallies (
+                party_id SMALLINT PRIMARY KEY,
+                votes INTEGER NOT NULL DEFAULT 0
+            )''')
+
+            # Seed one row per party, backfilled from any existing votes
+            for party_id in PARTY_IDS.values():
+                c.execute('''INSERT INTO tallies (party_id, votes)
+                    SELECT %s, COUNT(*) FROM votes WHERE party_id = %s
+                    ON CONFLICT (party_id) DO NOTHING''', (party_id, party_id))
+
+            # Every inserted vote bumps its party's tally inside the same
+            # statement, so cast_vote needs no separate UPDATE
+            c.execute('''CREATE OR REPLACE FUNCTION bump_tally() RETURNS trigger AS $$
+                BEGIN
+                    UPDATE tallies SET votes = votes + 1 WHERE party_id = NEW.party_id;
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql''')
+            c.execute('''DO $$ BEGIN
+                IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_votes_tally') THEN
+                    CREATE TRIGGER trg_votes_tally AFTER INSERT ON votes
+                        FOR EACH ROW EXECUTE PROCEDURE bump_tally();
+                END IF;
+            END $$''')
+
             conn.commit()
             conn.close()
             print("✅ PostgreSQL database initialized successfully!")
             using_postgresql = True
 
-        except ImportError as e:
-            print(f"❌ PostgreSQL module not available: {e}")
-            print("💡 To fix: pip install psycopg2-binary")
-            print("🔄 Falling back to SQLite...")
-            using_postgresql = False
         except Exception as e:
             print(f"❌ PostgreSQL connection failed: {e}")
             print("🔄 Falling back to SQLite...")
             using_postgresql = False
 
+    # Every later query goes to the backend that was actually set up
+    USING_POSTGRES = using_postgresql
+
     if not using_postgresql:
         # SQLite fallback
         try:
-            conn = sqlite3.connect('voting.db')
+            conn = sqlite3.connect(SQLITE_DB)
             c = conn.cursor()
 
+            # Switch the database file to WAL before creating tables
+            for pragma in SQLITE_PRAGMAS:
+                c.execute(pragma)
+
+            # Create or migrate the schema in one transaction, so a failed
+            # migration leaves the old tables untouched
+            c.execute('BEGIN')
+
+            # Older databases stored the party name in every vote. SQLite
+            # can't change a column's type, so move that table aside and
+            # copy its rows into the new layout below; its index and
+            # trigger go with it, and the tallies are rebuilt from scratch
+            legacy_votes = 'party' in {
+                column[1] for column in c.execute('PRAGMA table_info(votes)')}
+            if legacy_votes:
+                c.execute('ALTER TABLE votes RENAME TO votes_legacy')
+                c.execute('DROP TABLE IF EXISTS tallies')
+
             # Create votes table
             c.execute('''CREATE TABLE IF NOT EXISTS votes (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                party TEXT NOT NULL,
+                party_id INTEGER NOT NULL,
                 ip_address TEXT NOT NULL,
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
             )''')
 
-            # Create voters table
+            if legacy_votes:
+                c.execute('INSERT INTO votes (id, party_id, ip_address, timestamp) '
+                          'SELECT id, ' + _sqlite_placeholders(SQL_PARTY_ID_CASE)
+                          + ', ip_address, timestamp FROM votes_legacy',
+                          PARTY_ID_CASE_PARAMS)
+                c.execute('DROP TABLE votes_legacy')
+
+            # Create voters table (ip_address holds the packed address,
+            # see _ip_key)
             c.execute('''CREATE TABLE IF NOT EXISTS voters (
-                ip_address TEXT PRIMARY KEY,
+                ip_address BLOB PRIMARY KEY,
                 voted_at DATETIME DEFAULT CURRENT_TIMESTAMP
             )''')
 
+            # Older databases stored voter IPs as text; pack them in place
+            # (a TEXT column still stores BLOB values as-is) and drop any
+            # that turn out to duplicate an already packed address
+            rows = c.execute(
+                "SELECT ip_address FROM voters WHERE typeof(ip_address) = 'text'").fetchall()
+            for (ip_address,) in rows:
+                c.execute('UPDATE OR IGNORE voters SET ip_address = ? WHERE ip_address = ?',
+                          (_pack_ip(ip_address), ip_address))
+            c.execute("DELETE FROM voters WHERE typeof(ip_address) = 'text'")
+
+            # Index votes by party so the per-party tally is index-only
+            c.execute(
+                'CREATE INDEX IF NOT EXISTS idx_votes_party ON votes(party_id)')
+
+            # Create tallies table (running per-party totals for results)
+            c.execute('''CREATE TABLE IF NOT EXISTS tallies (
+                party_id INTEGER PRIMARY KEY,
+                votes INTEGER NOT NULL DEFAULT 0
+            )''')
+
+            # Seed one row per party, backfilled from any existing votes
+            for party_id in PARTY_IDS.values():
+                c.execute('''INSERT INTO tallies (party_id, votes)
+                    SELECT ?, COUNT(*) FROM votes WHERE party_id = ?
+                    ON CONFLICT (party_id) DO NOTHING''', (party_id, party_id))
+
+            # Every inserted vote bumps its party's tally inside the same
+            # statement, so cast_vote needs no separate UPDATE
+            c.execute('''CREATE TRIGGER IF NOT EXISTS trg_votes_tally
+                AFTER INSERT ON votes
+                BEGIN
+                    UPDATE tallies SET votes = votes + 1 WHERE party_id = NEW.party_id;
+                END''')
+
+            # Refresh planner statistics (only does work when they're stale)
+            c.execute('PRAGMA optimize')
+
             conn.commit()
             conn.close()
             print("✅ SQLite database initialized successfully!")
@@ -162,20 +547,107 @@ def init_db():
             raise
 
 
-def execute_query(query, params=None, fetch=False):
+@lru_cache(maxsize=64)
+def _sqlite_placeholders(query):
+    """query with '%s' placeholders rewritten to '?', once per distinct string"""
+    # Only replace literal %s placeholders.
+    # (If you need more complex parsing, switch to regex.)
+    return query.replace('%s', '?')
+
+
+def _adapt_query(query):
+    """
+    Adapt a psycopg2-style query to the backend: on PostgreSQL the
+    statements in PG_PREPARED_STATEMENTS become an EXECUTE of their
+    prepared form, on SQLite '%s' placeholders become '?'
+    """
+    if USING_POSTGRES:
+        return _PG_EXECUTE.get(query, query)
+    # The app only issues a handful of fixed query strings
+    return _sqlite_placeholders(query)
+
+
+def _pack_ip(ip_address):
+    """Packed 4/16-byte form of an IP literal; other strings as UTF-8 bytes"""
+    try:
+        family = socket.AF_INET6 if ':' in ip_address else socket.AF_INET
+        return socket.inet_pton(family, ip_address)
+    except OSError:
+        return ip_address.encode('utf-8')
+
+
+def _ip_key(ip_address):
+    """
+    Value stored in voters.ip_address for a client IP. SQLite keeps the
+    packed address as a BLOB: a smaller primary-key index, compared with a
+    plain memcmp. PostgreSQL keeps its existing TEXT column.
+    """
+    if ip_address is None or USING_POSTGRES:
+        return ip_address
+    return _pack_ip(ip_address)
+
+
+# Statements on the request path are module constants so every call sends
+# the same SQL text: PostgreSQL connections PREPARE them once (below) and
+# SQLite's per-connection statement cache reuses their compiled form
+SQL_HAS_VOTED = "SELECT 1 FROM voters WHERE ip_address = %s LIMIT 1"
+SQL_CLAIM_VOTER = ("INSERT INTO voters (ip_address) VALUES (%s) "
+                   "ON CONFLICT (ip_address) DO NOTHING")
+SQL_INSERT_VOTE = "INSERT INTO votes (party_id, ip_address) VALUES (%s, %s)"
+# PostgreSQL only: both of the above in one statement; the vote is only
+# inserted if the claim went through
+SQL_CAST_VOTE = ("WITH claimed AS (" + SQL_CLAIM_VOTER + " RETURNING ip_address) "
+                 "INSERT INTO votes (party_id, ip_address) "
+                 "SELECT %s, ip_address FROM claimed")
+SQL_RANKINGS = "SELECT party_id, votes FROM tallies ORDER BY votes DESC, party_id"
+
+# Prepared-statement name and parameter types of those PostgreSQL runs
+PG_PREPARED_STATEMENTS = {
+    SQL_HAS_VOTED: ('has_voted', ('text',)),
+    SQL_CAST_VOTE: ('cast_vote', ('text', 'smallint')),
+    SQL_RANKINGS: ('rankings', ()),
+}
+_PG_EXECUTE = {
+    query: f"EXECUTE {name}" + (f" ({', '.join(['%s'] * len(types))})" if types else '')
+    for query, (name, types) in PG_PREPARED_STATEMENTS.items()
+}
+
+
+def _pg_prepare(query, name, types):
+    """PREPARE statement for query; its '%s' placeholders become $1, $2, ..."""
+    parts = query.split('%s')
+    body = parts[0] + ''.join(f'${i}{part}' for i, part in enumerate(parts[1:], 1))
+    signature = f" ({', '.join(types)})" if types else ''
+    return f"PREPARE {name}{signature} AS {body}"
+
+
+# All of them in one string, so a new connection prepares them in a single
+# round trip
+_PG_PREPARE_BATCH = ';\n'.join(
+    _pg_prepare(query, name, types)
+    for query, (name, types) in PG_PREPARED_STATEMENTS.items())
+
+
+def _prepare_statements(conn):
+    """PREPARE the request-path statements on a new PostgreSQL connection"""
+    conn.cursor().execute(_PG_PREPARE_BATCH)
+    # Prepared statements live for the session; end PREPARE's transaction
+    conn.commit()
+    conn.statements_prepared = True
+
+
+def execute_query(query, params=None, fetch=None):
     """
     Execute database query with proper connection handling.
     This function automatically converts psycopg2-style '%s' placeholders
     to sqlite3-style '?' when running against SQLite.
+    fetch='one' returns fetchone(), fetch='all' returns fetchall(), and
+    fetch=None returns nothing. Only writes are committed.
     """
-    database_url = os.environ.get('DATABASE_URL')
-    using_postgres = bool(database_url and database_url.startswith('postgres'))
-
-    # If using sqlite and query uses %s placeholders, convert them to ?
-    if not using_postgres:
-        # Only replace literal %s placeholders.
-        # (If you need more complex parsing, switch to regex.)
-        query = query.replace('%s', '?')
+    if fetch not in (None, 'one', 'all'):
+        raise ValueError(f"fetch must be None, 'one' or 'all', not {fetch!r}")
+    is_read = query.lstrip()[:6].lower() == 'select'
+    query = _adapt_query(query)
 
     conn = get_db_connection()
     try:
@@ -185,28 +657,105 @@ def execute_query(query, params=None, fetch=False):
         else:
             c.execute(query)
 
-        if fetch:
-            # For SELECT COUNT(*) and other selects -> fetchone; for others -> fetchall if needed
-            # We'll return fetchone() if query starts with SELECT (common case)
-            qstr = query.strip().lower()
-            if qstr.startswith('select'):
-                result = c.fetchone()
-            else:
-                result = c.fetchall()
+        if fetch == 'one':
+            result = c.fetchone()
+        elif fetch == 'all':
+            result = c.fetchall()
         else:
             result = None
 
-        conn.commit()
+        # A read has nothing to commit; on PostgreSQL the pool ends the
+        # read's implicit transaction when the connection is handed back
+        if not is_read:
+            conn.commit()
         return result
+    except Exception:
+        # Don't leave a half-open transaction on a pooled connection
+        conn.rollback()
+        raise
     finally:
-        conn.close()
+        release_db_connection(conn)
+
+
+@contextmanager
+def db_transaction():
+    """
+    Run several statements on one connection as a single transaction.
+    Yields a cursor; commits on success and rolls back on any error.
+    On SQLite the write lock is taken up front (BEGIN IMMEDIATE) so
+    concurrent voters queue up instead of racing each other.
+    Queries executed on the cursor must go through _adapt_query().
+    """
+    if USING_POSTGRES:
+        conn = get_db_connection()
+    else:
+        # SQLite writes all go through the one writer connection
+        try:
+            conn = _sqlite_writer.get(timeout=SQLITE_WRITER_TIMEOUT)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                "timed out waiting for the SQLite writer connection")
+        if conn is None:
+            try:
+                conn = _get_sqlite_connection()
+            except Exception:
+                # Hand the slot back so the next write can try again
+                _sqlite_writer.put(None)
+                raise
+    try:
+        c = conn.cursor()
+        if isinstance(conn, sqlite3.Connection):
+            c.execute('BEGIN IMMEDIATE')
+        yield c
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if USING_POSTGRES:
+            release_db_connection(conn)
+        else:
+            _sqlite_writer.put(conn)
+
+
+# Voter IPs mirrored into a Redis set so the per-page has_voted() check
+# skips the database for visitors who haven't voted. The set is loaded once
+# from votes (marked by VOTERS_LOADED_KEY) and kept current by cast_vote.
+# The database stays the authority: the set can outlive it (a redeploy with
+# a fresh voting.db, the PostgreSQL to SQLite fallback), so a hit is only a
+# hint and is confirmed there, and cast_vote's primary-key claim still
+# rejects double votes.
+VOTERS_REDIS_KEY = 'voters:ips'
+VOTERS_LOADED_KEY = 'voters:ips:loaded'
+_voters_cache_ready = False
+
+
+def preload_voters_cache():
+    """Fill the Redis voter set from the database unless already loaded"""
+    global _voters_cache_ready
+    if redis_client is None:
+        return
+    if not _redis('exists', VOTERS_LOADED_KEY):
+        # votes keeps the readable IP text alongside every voters row
+        rows = execute_query("SELECT DISTINCT ip_address FROM votes", fetch='all')
+        ips = [ip for (ip,) in rows]
+        for start in range(0, len(ips), 1000):
+            if _redis('sadd', VOTERS_REDIS_KEY, *ips[start:start + 1000]) is None:
+                return
+        if _redis('set', VOTERS_LOADED_KEY, 1) is None:
+            return
+    _voters_cache_ready = True
 
 
 def has_voted(ip_address):
     """Check if an IP address has already voted"""
+    if _voters_cache_ready:
+        voted = _redis('sismember', VOTERS_REDIS_KEY, ip_address)
+        if voted is not None and not voted:
+            return False
+
     try:
-        result = execute_query(
-            "SELECT ip_address FROM voters WHERE ip_address = %s", (ip_address,), fetch=True)
+        result = execute_query(SQL_HAS_VOTED, (_ip_key(ip_address),), fetch='one')
         # For sqlite this query will be converted to '?', and fetch returns a tuple or None
         return result is not None
     except Exception as e:
@@ -215,46 +764,184 @@ def has_voted(ip_address):
 
 
 def cast_vote(party, ip_address):
-    """Cast a vote and record the IP"""
-    # Use parameterized queries; execute_query will adapt placeholders
-    execute_query(
-        "INSERT INTO votes (party, ip_address) VALUES (%s, %s)", (party, ip_address))
-    execute_query(
-        "INSERT INTO voters (ip_address) VALUES (%s)", (ip_address,))
+    """
+    Cast a vote, record the IP and bump the party tally atomically.
+    Returns False without recording anything if the IP has already voted.
+    """
+    # Both statements share one transaction and a single commit
+    with db_transaction() as c:
+        # voters.ip_address is the primary key, so claiming the IP here is
+        # both the duplicate check and the record of it - no separate
+        # has_voted() round trip and no window for a concurrent double vote.
+        # The trg_votes_tally trigger bumps the party's tally in tallies.
+        if USING_POSTGRES:
+            # Claim and insert in a single round trip
+            c.execute(_adapt_query(SQL_CAST_VOTE), (ip_address, PARTY_IDS[party]))
+            if c.rowcount == 0:
+                return False
+        else:
+            c.execute(_adapt_query(SQL_CLAIM_VOTER), (_ip_key(ip_address),))
+            if c.rowcount == 0:
+                return False
+            c.execute(_adapt_query(SQL_INSERT_VOTE), (PARTY_IDS[party], ip_address))
+    if _voters_cache_ready:
+        _redis('sadd', VOTERS_REDIS_KEY, ip_address)
+    invalidate_rankings_cache()
+    return True
+
+
+# get_rankings() is hit by every open results tab every few seconds, so
+# the result is shared for a short while; cast_vote drops it early.
+# Behind the per-worker copy sits the Redis one (when configured), which
+# lets all workers share a single database read. The Redis copy is keyed
+# by a vote epoch that cast_vote bumps, so a rebuild that raced with a
+# vote lands under the old epoch and is never served.
+RANKINGS_CACHE_TTL = 1.0
+RANKINGS_REDIS_TTL = 60
+RANKINGS_REDIS_KEY = 'rankings:json:{epoch}'
+VOTES_EPOCH_KEY = 'votes:epoch'
+_rankings_cache = None  # (expires_at, rankings, json_body, etag)
+_rankings_cache_lock = threading.Lock()
+
+
+# Wakes /api/stream listeners in this process whenever a vote is cast
+_results_changed = threading.Condition()
+_results_version = 0
+
+# Votes cast in other workers reach this one's listeners over Redis pub/sub
+VOTES_CHANNEL = 'votes_updated'
+_votes_listener = None
+_votes_listener_lock = threading.Lock()
+
+# Seconds between SSE keep-alive comments, and how long one stream may stay
+# open before the browser is left to reconnect (freeing the worker)
+STREAM_KEEPALIVE = 15
+STREAM_MAX_AGE = 300
+
+
+def _results_updated():
+    """Drop this worker's cached rankings and wake its stream listeners"""
+    global _rankings_cache, _results_version
+    # Under the same lock that _get_rankings_entry() installs entries with,
+    # so a rebuild that overlapped this vote can't put its result back
+    with _results_changed:
+        _results_version += 1
+        _rankings_cache = None
+        _results_changed.notify_all()
+
+
+def invalidate_rankings_cache():
+    """Forget the cached rankings and tell stream listeners to re-send them"""
+    _redis('incr', VOTES_EPOCH_KEY)
+    _results_updated()
+    # The pid lets this worker skip its own announcement
+    _redis('publish', VOTES_CHANNEL, str(os.getpid()))
+
+
+def _listen_for_votes():
+    """Relay votes announced by other workers to this worker's listeners"""
+    while True:
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(VOTES_CHANNEL)
+            for message in pubsub.listen():
+                if message['data'] != str(os.getpid()).encode():
+                    _results_updated()
+        except Exception as e:
+            app.logger.warning(f"Redis subscription to {VOTES_CHANNEL} failed: {e}")
+            time.sleep(STREAM_KEEPALIVE)
+
+
+def _start_votes_listener():
+    """
+    Start the pub/sub relay once per worker. It is started from the first
+    stream request rather than at import so that it lives in the worker
+    process, not in a master that forks it.
+    """
+    global _votes_listener
+    if redis_client is None or _votes_listener is not None:
+        return
+    with _votes_listener_lock:
+        if _votes_listener is None:
+            _votes_listener = threading.Thread(
+                target=_listen_for_votes, name='votes-listener', daemon=True)
+            _votes_listener.start()
+
+
+def _get_rankings_entry():
+    """Return the cached rankings entry, rebuilding it once it has expired"""
+    global _rankings_cache
+    cached = _rankings_cache
+    if cached and cached[0] > time.monotonic():
+        return cached
+
+    with _rankings_cache_lock:
+        # Another thread may have refreshed it while we waited
+        cached = _rankings_cache
+        if cached and cached[0] > time.monotonic():
+            return cached
+        version = _results_version
+        # Read the epoch before the tallies so the entry is filed under
+        # an epoch no newer than the data it was built from
+        key = RANKINGS_REDIS_KEY.format(epoch=int(_redis('get', VOTES_EPOCH_KEY) or 0))
+        body = _redis('get', key)
+        if body is not None:
+            rankings = loads_json(body)
+        else:
+            rankings = _build_rankings()
+            # Serialize once per refresh so /api/results can serve the
+            # bytes as-is and answer unchanged polls with 304 via the ETag
+            body = dumps_json(rankings)
+            _redis('set', key, body, ex=RANKINGS_REDIS_TTL)
+        etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+        cached = (time.monotonic() + RANKINGS_CACHE_TTL, rankings, body, etag)
+        with _results_changed:
+            # A vote landed while this was being built, so it may predate
+            # that vote: hand it to this caller only, and let the next
+            # read rebuild
+            if _results_version == version:
+                _rankings_cache = cached
+    return cached
+
+
+def get_rankings():
+    """Get parties ranked by vote count, cached for RANKINGS_CACHE_TTL seconds"""
+    return _get_rankings_entry()[1]
 
 
 def get_vote_counts():
     """Get current vote counts for all parties"""
-    vote_counts = {}
-    for party in PARTIES:
-        try:
-            result = execute_query(
-                "SELECT COUNT(*) FROM votes WHERE party = %s", (party,), fetch=True)
-            if result:
-                # Extract the count from the tuple (count,)
-                count = result[0]  # Get first element of the tuple
-            else:
-                count = 0
-        except Exception as e:
-            # Log error if desired
-            # print(f"get_vote_counts error for {party}: {e}")
-            count = 0
-        vote_counts[party] = count
-
+    # Same single tallies read (and cache) as the rankings, keyed by party
+    vote_counts = {party: 0 for party in PARTIES}
+    for item in get_rankings():
+        vote_counts[item['party']] = item['votes']
     return vote_counts
 
 
-def get_rankings():
-    """Get parties ranked by vote count"""
-    vote_counts = get_vote_counts()
-    sorted_parties = sorted(vote_counts.items(),
-                            key=lambda x: x[1], reverse=True)
+def get_rankings_json():
+    """Get the rankings as pre-encoded JSON bytes plus their ETag"""
+    _, _, body, etag = _get_rankings_entry()
+    return body, etag
+
+
+def _build_rankings():
+    """Rank parties by vote count straight from the database"""
+    try:
+        # tallies holds one row per party, so the database hands them back
+        # already ranked; ties keep the PARTIES order
+        rows = execute_query(SQL_RANKINGS, fetch='all')
+        rows = [(PARTIES[party_id], votes) for party_id, votes in rows
+                if 0 <= party_id < len(PARTIES)]
+    except Exception as e:
+        # Log error if desired
+        # print(f"_build_rankings error: {e}")
+        rows = [(party, 0) for party in PARTIES]
 
     # Calculate total votes
-    total_votes = sum(vote_counts.values())
+    total_votes = sum(votes for _, votes in rows)
 
     rankings = []
-    for i, (party, votes) in enumerate(sorted_parties, 1):
+    for i, (party, votes) in enumerate(rows, 1):
         # Calculate percentage
         percentage = (votes / total_votes * 100) if total_votes > 0 else 0
 
@@ -263,88 +950,161 @@ def get_rankings():
             'party': party,
             'votes': votes,
             'percentage': round(percentage, 1),
-            'meme': RANKING_MEMES.get(i, RANKING_MEMES[5])
+            'meme': RANKING_MEMES[min(i, len(RANKING_MEMES)) - 1]
         })
 
     return rankings
 
 
+def _client_ip():
+    """Client IP behind a proxy, looked up once and kept on g for the request"""
+    ip = g.get('_client_ip')
+    if ip is None:
+        # ProxyFix has already taken the client from X-Forwarded-For
+        if request.headers.get('X-Forwarded-For') or not TRUSTED_PROXY_HOPS:
+            ip = request.remote_addr
+        else:
+            ip = request.headers.get('X-Real-IP', request.remote_addr)
+        g._client_ip = ip
+    return ip
+
+
+# The pages are static apart from, on the results page, whether the
+# visitor has voted; the rankings themselves are fetched by the page's
+# script. Each (template, variant) is rendered once and served as bytes.
+# Nothing from the request goes into a page: og:url is the canonical page
+# URL without the query string (fbclid, utm_* and the like), taken from
+# CANONICAL_URL when set, else from the first request's host.
+app.config['CANONICAL_URL'] = os.environ.get('CANONICAL_URL', '').rstrip('/')
+_rendered_pages = {}
+
+
+def _render_page(template_name, variant=None, **context):
+    """Rendered template for the given variant, from cache when possible"""
+    key = (template_name, variant)
+    g.compress_key = key
+    page = _rendered_pages.get(key)
+    if page is None:
+        canonical = app.config['CANONICAL_URL']
+        page_url = canonical + request.path if canonical else request.base_url
+        page = render_template(template_name, page_url=page_url,
+                               **context).encode('utf-8')
+        _rendered_pages[key] = page
+    return page
+
+
 @app.route('/')
 def index():
     """Main voting page"""
-    # Better IP detection for production
-    client_ip = request.headers.get('X-Forwarded-For',
-                                    request.headers.get('X-Real-IP',
-                                                        request.environ.get('HTTP_X_FORWARDED_FOR',
-                                                                            request.remote_addr)))
-
-    if client_ip and ',' in client_ip:
-        client_ip = client_ip.split(',')[0].strip()
+    client_ip = _client_ip()
 
     if has_voted(client_ip):
         return redirect(url_for('results'))
 
-    return render_template('index.html', parties=PARTIES)
+    return Response(_render_page('index.html', parties=PARTIES), mimetype='text/html')
 
 
 @app.route('/vote', methods=['POST'])
 def vote():
     """Handle vote submission"""
-    # Better IP detection for production
-    client_ip = request.headers.get('X-Forwarded-For',
-                                    request.headers.get('X-Real-IP',
-                                                        request.environ.get('HTTP_X_FORWARDED_FOR',
-                                                                            request.remote_addr)))
-
-    if client_ip and ',' in client_ip:
-        client_ip = client_ip.split(',')[0].strip()
+    client_ip = _client_ip()
 
     try:
-        if has_voted(client_ip):
-            return jsonify({'success': False, 'message': 'আপনি ইতিমধ্যে ভোট দিয়েছেন!'})
-
         party = request.json.get('party')
         if not party:
-            return jsonify({'success': False, 'message': 'দল নির্বাচন করুন!'})
+            return json_response({'success': False, 'message': 'দল নির্বাচন করুন!'})
 
-        if party not in PARTIES:
-            return jsonify({'success': False, 'message': 'ভুল দল নির্বাচন!'})
+        # Checked first: a list or dict can't be looked up in the set
+        if not isinstance(party, str) or party not in PARTIES_SET:
+            return json_response({'success': False, 'message': 'ভুল দল নির্বাচন!'})
 
-        cast_vote(party, client_ip)
-        return jsonify({'success': True, 'message': 'আপনার ভোট সফলভাবে গ্রহণ করা হয়েছে!'})
+        # cast_vote checks and records the voter in one statement
+        if not cast_vote(party, client_ip):
+            return json_response({'success': False, 'message': 'আপনি ইতিমধ্যে ভোট দিয়েছেন!'})
+
+        return json_response({'success': True, 'message': 'আপনার ভোট সফলভাবে গ্রহণ করা হয়েছে!'})
     except Exception as e:
         app.logger.error(f"Vote submission error: {str(e)}")
-        return jsonify({'success': False, 'message': 'ভোট দিতে সমস্যা হয়েছে! অনুগ্রহ করে আবার চেষ্টা করুন।'})
+        return json_response({'success': False, 'message': 'ভোট দিতে সমস্যা হয়েছে! অনুগ্রহ করে আবার চেষ্টা করুন।'})
 
 
 @app.route('/results')
 def results():
     """Results page"""
-    # Better IP detection for production
-    client_ip = request.headers.get('X-Forwarded-For',
-                                    request.headers.get('X-Real-IP',
-                                                        request.environ.get('HTTP_X_FORWARDED_FOR',
-                                                                            request.remote_addr)))
-
-    if client_ip and ',' in client_ip:
-        client_ip = client_ip.split(',')[0].strip()
+    client_ip = _client_ip()
 
     has_user_voted = has_voted(client_ip)
-    rankings = get_rankings()
-    return render_template('results.html', rankings=rankings, has_voted=has_user_voted)
+    # Cached on (template, has_voted) alone: the query string and Host
+    # never pick a different copy
+    page = _render_page('results.html', has_user_voted, has_voted=has_user_voted)
+    return Response(page, mimetype='text/html')
+
+
+def _etag_matches(etag):
+    """
+    Whether the request's If-None-Match covers etag. Flask-Compress appends
+    the encoding (e.g. "abc:gzip") to ETags of compressed responses, so
+    that suffix is ignored when comparing.
+    """
+    if_none_match = request.if_none_match
+    if if_none_match.star_tag:
+        return True
+    return any(tag.split(':', 1)[0] == etag
+               for tag in if_none_match.as_set(include_weak=True))
 
 
 @app.route('/api/results')
 def api_results():
     """API endpoint for getting current results"""
-    return jsonify(get_rankings())
+    body, etag = get_rankings_json()
+    # Polls whose If-None-Match still matches get an empty 304
+    if _etag_matches(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype='application/json')
+        g.compress_key = ('api_results', etag)
+    response.set_etag(etag)
+    response.cache_control.max_age = 1
+    # Lets a CDN in front of the app absorb the polls of many viewers
+    response.cache_control.s_maxage = 2
+    return response
+
+
+@app.route('/api/stream')
+def api_stream():
+    """Server-Sent Events stream that pushes the results after every vote"""
+    _start_votes_listener()
+
+    def generate():
+        deadline = time.monotonic() + STREAM_MAX_AGE
+        sent_version = sent_etag = None
+        while time.monotonic() < deadline:
+            with _results_changed:
+                if sent_version == _results_version:
+                    _results_changed.wait(timeout=STREAM_KEEPALIVE)
+                sent_version = _results_version
+
+            # Also checked when the wait times out: without Redis, votes
+            # recorded by another worker never wake this one
+            body, etag = get_rankings_json()
+            if etag == sent_etag:
+                # Comment line keeps proxies from closing an idle stream
+                yield b': keep-alive\n\n'
+                continue
+
+            sent_etag = etag
+            yield b'data: ' + body + b'\n\n'
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache',
+                             'X-Accel-Buffering': 'no'})
 
 
 @app.route('/health')
 def health():
     """Health check endpoint"""
     db_status = "PostgreSQL" if is_postgresql_available() else "SQLite"
-    return jsonify({
+    return json_response({
         'status': 'healthy',
         'database': db_status,
         'timestamp': datetime.now().isoformat()
@@ -361,23 +1121,23 @@ def initialize_database():
         print(f"❌ Database initialization failed: {e}")
         raise e
 
+    try:
+        preload_voters_cache()
+    except Exception as e:
+        # Not fatal: has_voted() keeps querying the database
+        print(f"❌ Voter cache preload failed: {e}")
 
-# Initialize database when the application starts
-initialize_database()
-
-if __name__ == '__main__':
-    print("🚀 Starting Bangladesh Opinion Poll App...")
-
-    # Production ready configuration
-    port = int(os.environ.get('PORT', 5000))
-    debug = os.environ.get('FLASK_ENV') != 'production'
+    # With gunicorn's preload_app this runs in the master, and a forked
+    # worker must not share the master's database connections, so close
+    # whatever startup opened; each worker opens its own on first use
+    _close_sqlite_connections()
+    _close_pg_pool()
 
-    print(f"🌐 Server starting on port {port}")
-    print(f"🔧 Debug mode: {debug}")
 
-    app.run(host='0.0.0.0', port=port, debug=debug)
+# Initialize database when the application starts
+initialize_database()
 
-# HTML Templates (save these as separate files in templates/ folder)
+# HTML Templates (served from memory via DictLoader below)
 
 # templates/base.html
 BASE_HTML = """
@@ -394,7 +1154,7 @@ BASE_HTML = """
     <meta property="og:image" content="https://cdn.bdnews24.com/bdnews24/media/bdnews24-english/2024-01/78ea831f-a6e1-4a29-8740-44b2699c10e7/dhaka_17_bypolls_170723_37.jpg" />
     <meta property="og:image:width" content="1200" />
     <meta property="og:image:height" content="630" />
-    <meta property="og:url" content="{{ request.url }}" />
+    <meta property="og:url" content="{{ page_url }}" />
     <meta property="og:type" content="website" />
     <meta property="og:site_name" content="বাংলাদেশ জনমত সংগ্রহ" />
     
@@ -644,31 +1404,59 @@ RESULTS_HTML = """
 </div>
 
 <script>
+    // One card per party, kept across updates so that an unchanged result
+    // leaves the page untouched
+    const cards = {};
+    
+    function renderResults(rankings) {
+        const container = document.getElementById('results-container');
+        if (!container.querySelector('.results-card')) {
+            // First results (or after an error message): drop the placeholder
+            container.innerHTML = '';
+            for (const party in cards) delete cards[party];
+        }
+        
+        rankings.forEach((item, index) => {
+            let card = cards[item.party];
+            if (!card) {
+                card = document.createElement('div');
+                card.dataset.party = item.party;
+                cards[item.party] = card;
+            }
+            
+            if (card.dataset.rank !== String(item.rank)) {
+                // The rank decides the card's look, so rebuild it
+                card.className = `results-card rank-${item.rank}`;
+                
+                const rankEmojis = ['🥇', '🥈', '🥉', '😢', '💔'];
+                const rankEmoji = rankEmojis[item.rank - 1] || '💔';
+                
+                card.innerHTML = `
+                    <img src="${item.meme}" alt="Rank ${item.rank} meme" class="meme-img">
+                    <h3>${rankEmoji} ${item.rank === 1 ? 'WINNER' : item.rank + getSuffix(item.rank) + ' Place'}</h3>
+                    <h4>${item.party}</h4>
+                    <div class="vote-count">${item.votes} ভোট</div>
+                    <div style="clear: both;"></div>
+                `;
+                card.dataset.rank = item.rank;
+                card.dataset.votes = item.votes;
+            } else if (card.dataset.votes !== String(item.votes)) {
+                // Same place, new count: only the count's text changes
+                card.querySelector('.vote-count').textContent = `${item.votes} ভোট`;
+                card.dataset.votes = item.votes;
+            }
+            
+            // Only move the card when its party changed places
+            if (container.children[index] !== card) {
+                container.insertBefore(card, container.children[index] || null);
+            }
+        });
+    }
+    
     function updateResults() {
         fetch('/api/results')
             .then(response => response.json())
-            .then(rankings => {
-                const container = document.getElementById('results-container');
-                container.innerHTML = '';
-                
-                rankings.forEach((item, index) => {
-                    const card = document.createElement('div');
-                    card.className = `results-card rank-${item.rank}`;
-                    
-                    const rankEmojis = ['🥇', '🥈', '🥉', '😢', '💔'];
-                    const rankEmoji = rankEmojis[item.rank - 1] || '💔';
-                    
-                    card.innerHTML = `
-                        <img src="${item.meme}" alt="Rank ${item.rank} meme" class="meme-img">
-                        <h3>${rankEmoji} ${item.rank === 1 ? 'WINNER' : item.rank + getSuffix(item.rank) + ' Place'}</h3>
-                        <h4>${item.party}</h4>
-                        <div class="vote-count">${item.votes} ভোট</div>
-                        <div style="clear: both;"></div>
-                    `;
-                    
-                    container.appendChild(card);
-                });
-            })
+            .then(renderResults)
             .catch(error => {
                 console.error('Error loading results:', error);
                 document.getElementById('results-container').innerHTML = 
@@ -705,20 +1493,63 @@ RESULTS_HTML = """
     // Initial load
     updateResults();
     
-    // Auto refresh every 5 seconds for real-time updates
-    setInterval(updateResults, 5000);
+    // Real-time updates: the server pushes new results over Server-Sent
+    // Events whenever a vote is cast; a slow poll stays as a safety net
+    if (window.EventSource) {
+        const stream = new EventSource('/api/stream');
+        stream.onmessage = event => renderResults(JSON.parse(event.data));
+        setInterval(updateResults, 30000);
+    } else {
+        // Auto refresh every 5 seconds for real-time updates
+        setInterval(updateResults, 5000);
+    }
 </script>
 {% endblock %}
 """
 
-# Create template files
-os.makedirs('templates', exist_ok=True)
+# Serve the templates straight from the strings above; nothing is written
+# to disk, and Jinja compiles and caches each one once per process
+app.jinja_loader = DictLoader({
+    'base.html': BASE_HTML,
+    'index.html': INDEX_HTML,
+    'results.html': RESULTS_HTML,
+})
+
+# In production the compiled templates are also kept on disk, so a newly
+# started worker loads them instead of compiling again. JINJA_CACHE_DIR
+# picks the directory; by default it is a per-user temp directory.
+app.config['JINJA_CACHE_DIR'] = os.environ.get('JINJA_CACHE_DIR')
+if not app.config['DEBUG']:
+    try:
+        cache_dir = app.config['JINJA_CACHE_DIR']
+        if cache_dir:
+            # Jinja only writes here on the first render, so check now
+            # rather than failing that request
+            os.makedirs(cache_dir, exist_ok=True)
+            if not os.access(cache_dir, os.W_OK | os.X_OK):
+                raise OSError(f"{cache_dir} is not writable")
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    except (OSError, RuntimeError) as e:
+        print(f"Template bytecode cache unavailable ({e}). "
+              "Compiling templates in each worker.")
+
+if __name__ == '__main__':
+    print("🚀 Starting Bangladesh Opinion Poll App...")
+
+    # Production ready configuration
+    port = int(os.environ.get('PORT', 5000))
+    debug = os.environ.get('FLASK_ENV') != 'production'
 
-with open('templates/base.html', 'w', encoding='utf-8') as f:
-    f.write(BASE_HTML)
+    if not debug:
+        # Werkzeug's server is for development only; hand over to gunicorn
+        # (settings in gunicorn.conf.py) so requests are served concurrently
+        print("🌐 Handing over to gunicorn (see gunicorn.conf.py)")
+        here = os.path.dirname(os.path.abspath(__file__))
+        os.execvp('gunicorn', ['gunicorn', '--chdir', here,
+                               '-c', os.path.join(here, 'gunicorn.conf.py'),
+                               'app:app'])
 
-with open('templates/index.html', 'w', encoding='utf-8') as f:
-    f.write(INDEX_HTML)
+    print(f"🌐 Server starting on port {port}")
+    print(f"🔧 Debug mode: {debug}")
 
-with open('templates/results.html', 'w', encoding='utf-8') as f:
-    f.write(RESULTS_HTML)
+    app.run(host='0.0.0.0', port=port, debug=debug)
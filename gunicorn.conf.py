@@ -0,0 +1,35 @@
+"""
+Gunicorn settings, picked up automatically by `gunicorn app:app`.
+
+gevent workers let many /api/results pollers and /api/stream listeners be
+in flight at once instead of one request per worker. The app is preloaded
+once in the master and forked into the workers, so database setup and the
+voter-cache preload run once and the workers share the loaded code
+copy-on-write.
+"""
+# A preloaded app is imported by the master, before gevent's worker would
+# patch anything, so patch here: the locks, queues and sockets the app
+# creates at import must cooperate with gevent in the workers
+from gevent import monkey
+monkey.patch_all()
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+worker_class = 'gevent'
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_connections = 1000
+preload_app = True
+
+
+def post_fork(server, worker):
+    """Make psycopg2 yield to other greenlets while it waits on PostgreSQL"""
+    if not os.environ.get('DATABASE_URL', '').startswith('postgres'):
+        return
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        print("psycogreen not available, PostgreSQL queries will block the worker.")
+        print("To fix, install: pip install psycogreen")
+        return
+    patch_psycopg()